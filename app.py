@@ -14,17 +14,21 @@ You can freely edit / extend this code.
 """
 
 import os
+import mimetypes
+import shutil
 import threading
 import queue
 import uuid
+import time
 import datetime
+from urllib.parse import quote
 
 from flask import (
     Flask, render_template, request, redirect,
-    url_for, send_from_directory, flash, jsonify
+    url_for, send_from_directory, flash, jsonify, make_response
 )
 
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 
 from models import (
     engine, Base, Project, Job, Media,
@@ -42,20 +46,39 @@ OUTPUT_DIR = os.path.join(BASE_DIR, "outputs")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB copy buffer for uploads
+
 # -------------------------------------------------------------------
 # Flask app
 # -------------------------------------------------------------------
 app = Flask(__name__)
 app.secret_key = "please-change-this-secret"
 
+# سرو فایل‌های خروجی توسط وب‌سرور جلویی به جای Python:
+# - nginx: MEDIA_ACCEL_PREFIX=/_protected_media/  (location internal با alias به outputs/)
+# - Apache mod_xsendfile: USE_X_SENDFILE=1
+MEDIA_ACCEL_PREFIX = os.environ.get("MEDIA_ACCEL_PREFIX", "")
+app.use_x_sendfile = os.environ.get("USE_X_SENDFILE") == "1"
+
 # ایجاد جداول دیتابیس در صورت عدم وجود
 Base.metadata.create_all(bind=engine)
+# create_all ایندکس‌ها را فقط برای جداول تازه می‌سازد؛ برای app.db موجود:
+for table in Base.metadata.sorted_tables:
+    for index in table.indexes:
+        index.create(bind=engine, checkfirst=True)
 
 # -------------------------------------------------------------------
 # Job Queue in memory (only for ordering); Job rows in DB
 # -------------------------------------------------------------------
 JOB_QUEUE: "queue.Queue[int]" = queue.Queue()
 
+# Throttling for progress commits from the worker
+PROGRESS_MIN_DELTA = 1         # percent
+PROGRESS_MIN_INTERVAL = 0.25   # seconds
+
+# Max number of queued jobs the worker picks up per DB session
+WORKER_BATCH_SIZE = 8
+
 def enqueue_job(project_id: int, audio_path: str, video_path: str) -> int:
     """
     Create a Job row in DB, enqueue its ID for background processing,
@@ -86,72 +109,129 @@ def enqueue_job(project_id: int, audio_path: str, video_path: str) -> int:
 # -------------------------------------------------------------------
 # Background worker
 # -------------------------------------------------------------------
-def worker_loop():
+def _next_batch() -> list:
     """
-    Background worker:
-    Takes Job IDs from JOB_QUEUE and runs them sequentially.
+    Block until a job is available, then drain up to WORKER_BATCH_SIZE
+    job IDs that are already waiting.
     """
-    while True:
-        job_id = JOB_QUEUE.get()  # block until a job is available
-        db: Session = get_session()
+    batch = [JOB_QUEUE.get()]
+    while len(batch) < WORKER_BATCH_SIZE:
         try:
-            job: Job = db.get(Job, job_id)
-            if not job:
-                JOB_QUEUE.task_done()
-                db.close()
-                continue
+            batch.append(JOB_QUEUE.get_nowait())
+        except queue.Empty:
+            break
+    return batch
 
-            job.status = "running"
-            job.progress = 5
-            job.message = "شروع پردازش..."
-            job.updated_at = datetime.datetime.now()
+def _run_job(db: Session, job: Job):
+    """
+    Run the pipeline for one job, recording progress and the final status.
+    """
+    job.status = "running"
+    job.progress = 5
+    job.message = "شروع پردازش..."
+    job.updated_at = datetime.datetime.now()
+    db.commit()
+
+    # فقط تغییرات مهم commit می‌شوند تا قفل نوشتن SQLite آزاد بماند
+    last = {"pct": job.progress, "msg": job.message, "ts": time.monotonic()}
+
+    def progress_callback(percent: int, msg: str):
+        # این تابع از داخل motion_pipeline فراخوانی می‌شود
+        j = db.get(Job, job.id)
+        if not j:
+            return
+        pct = max(0, min(100, int(percent)))
+        j.progress = pct
+        j.message = msg
+        j.updated_at = datetime.datetime.now()
+
+        now = time.monotonic()
+        if (abs(pct - last["pct"]) >= PROGRESS_MIN_DELTA
+                or msg != last["msg"]
+                or now - last["ts"] > PROGRESS_MIN_INTERVAL):
             db.commit()
+            last.update(pct=pct, msg=msg, ts=now)
 
-            def progress_callback(percent: int, msg: str):
-                # این تابع از داخل motion_pipeline فراخوانی می‌شود
-                j = db.get(Job, job_id)
-                if not j:
-                    return
-                j.progress = max(0, min(100, int(percent)))
-                j.message = msg
-                j.updated_at = datetime.datetime.now()
-                db.commit()
-
-            # اجرای pipeline
-            try:
-                output_path = motion_pipeline.process_job(
-                    audio_path=job.audio_path,
-                    video_path=job.video_path,
-                    output_dir=OUTPUT_DIR,
-                    progress_callback=progress_callback,
-                    quality="h",
-                )
-                # ذخیره Media
-                media = Media(
-                    project_id=job.project_id,
-                    job_id=job.id,
-                    file_path=output_path,
-                    media_type="video",
-                    created_at=datetime.datetime.now(),
-                )
-                db.add(media)
-
-                job.status = "done"
-                job.progress = 100
-                job.message = "تمام شد ✅"
-                job.output_path = output_path
-                job.updated_at = datetime.datetime.now()
-                db.commit()
-            except Exception as e:
-                job.status = "error"
-                job.progress = 0
-                job.message = "خطا در اجرای جاب"
-                job.error = str(e)
-                job.updated_at = datetime.datetime.now()
-                db.commit()
+    # اجرای pipeline
+    try:
+        output_path = motion_pipeline.process_job(
+            audio_path=job.audio_path,
+            video_path=job.video_path,
+            output_dir=OUTPUT_DIR,
+            progress_callback=progress_callback,
+            quality="h",
+        )
+        # ذخیره Media
+        media = Media(
+            project_id=job.project_id,
+            job_id=job.id,
+            file_path=output_path,
+            media_type="video",
+            created_at=datetime.datetime.now(),
+        )
+        db.add(media)
+
+        job.status = "done"
+        job.progress = 100
+        job.message = "تمام شد ✅"
+        job.output_path = output_path
+        job.updated_at = datetime.datetime.now()
+        db.commit()
+    except Exception as e:
+        job.status = "error"
+        job.progress = 0
+        job.message = "خطا در اجرای جاب"
+        job.error = str(e)
+        job.updated_at = datetime.datetime.now()
+        db.commit()
+
+def _mark_job_failed(job_id: int, exc: Exception):
+    """
+    Best-effort: record a failed job as "error" in a fresh session, so it
+    doesn't stay "running" in the UI.
+    """
+    db: Session = get_session()
+    try:
+        job = db.get(Job, job_id)
+        if not job:
+            return
+        job.status = "error"
+        job.progress = 0
+        job.message = "خطا در اجرای جاب"
+        job.error = str(exc)
+        job.updated_at = datetime.datetime.now()
+        db.commit()
+    except Exception:
+        db.rollback()
+        app.logger.exception("Could not mark job #%s as failed", job_id)
+    finally:
+        db.close()
 
+def worker_loop():
+    """
+    Background worker:
+    Takes batches of Job IDs from JOB_QUEUE and runs them sequentially,
+    sharing one DB session per batch.
+    """
+    while True:
+        batch = _next_batch()
+        db: Session = get_session()
+        try:
+            jobs = {j.id: j for j in db.query(Job).filter(Job.id.in_(batch))}
+            for job_id in batch:
+                job = jobs.get(job_id)
+                if not job:
+                    continue
+                try:
+                    _run_job(db, job)
+                except Exception as e:
+                    # مثلاً خطای دیتابیس؛ بقیه‌ی batch ادامه پیدا می‌کنند
+                    db.rollback()
+                    app.logger.exception("Job #%s failed outside the pipeline", job_id)
+                    _mark_job_failed(job_id, e)
         finally:
-            JOB_QUEUE.task_done()
+            for _ in batch:
+                JOB_QUEUE.task_done()
             db.close()
 
 # Start background worker thread
@@ -171,9 +251,20 @@ def _save_upload(file_obj, subdir: str) -> str:
     os.makedirs(folder, exist_ok=True)
     filename = file_obj.filename
     path = os.path.join(folder, filename)
-    file_obj.save(path)
+    with open(path, "wb") as dst:
+        shutil.copyfileobj(file_obj.stream, dst, UPLOAD_CHUNK_SIZE)
     return path
 
+def _row_with_project(obj) -> dict:
+    """
+    Snapshot a Job/Media row (plus its project's id/name) into a plain dict,
+    so the session can be closed before the template is rendered.
+    """
+    row = obj.to_dict()
+    project = obj.project
+    row["project"] = {"id": project.id, "name": project.name} if project else None
+    return row
+
 # -------------------------------------------------------------------
 # Routes
 # -------------------------------------------------------------------
@@ -228,10 +319,10 @@ def projects_list():
             return redirect(url_for("project_detail", project_id=project.id))
 
         # GET → لیست پروژه‌ها
-        projects = db.query(Project).order_by(Project.created_at.desc()).all()
-        return render_template("projects.html", projects=projects)
+        projects = [p.to_dict() for p in db.query(Project).order_by(Project.created_at.desc()).all()]
     finally:
         db.close()
+    return render_template("projects.html", projects=projects)
 
 @app.route("/projects/<int:project_id>")
 def project_detail(project_id: int):
@@ -244,11 +335,12 @@ def project_detail(project_id: int):
         if not project:
             flash("پروژه پیدا نشد.", "error")
             return redirect(url_for("projects_list"))
-        jobs = db.query(Job).filter(Job.project_id == project_id).order_by(Job.created_at.desc()).all()
-        medias = db.query(Media).filter(Media.project_id == project_id).order_by(Media.created_at.desc()).all()
-        return render_template("project_detail.html", project=project, jobs=jobs, medias=medias)
+        project = project.to_dict()
+        jobs = [j.to_dict() for j in db.query(Job).filter(Job.project_id == project_id).order_by(Job.created_at.desc()).all()]
+        medias = [m.to_dict() for m in db.query(Media).filter(Media.project_id == project_id).order_by(Media.created_at.desc()).all()]
     finally:
         db.close()
+    return render_template("project_detail.html", project=project, jobs=jobs, medias=medias)
 
 @app.route("/projects/<int:project_id>/new-job", methods=["POST"])
 def project_new_job(project_id: int):
@@ -280,10 +372,17 @@ def jobs_list():
     """
     db: Session = get_session()
     try:
-        jobs = db.query(Job).order_by(Job.created_at.desc()).limit(200).all()
-        return render_template("jobs.html", jobs=jobs)
+        jobs = (
+            db.query(Job)
+            .options(selectinload(Job.project))
+            .order_by(Job.created_at.desc())
+            .limit(200)
+            .all()
+        )
+        jobs = [_row_with_project(j) for j in jobs]
     finally:
         db.close()
+    return render_template("jobs.html", jobs=jobs)
 
 @app.route("/jobs/<int:job_id>")
 def jobs_detail(job_id: int):
@@ -296,9 +395,10 @@ def jobs_detail(job_id: int):
         if not job:
             flash("جاب پیدا نشد.", "error")
             return redirect(url_for("jobs_list"))
-        return render_template("job_detail.html", job=job)
+        job = _row_with_project(job)
     finally:
         db.close()
+    return render_template("job_detail.html", job=job)
 
 @app.route("/jobs/<int:job_id>/json")
 def jobs_status_json(job_id: int):
@@ -310,9 +410,19 @@ def jobs_status_json(job_id: int):
         job = db.get(Job, job_id)
         if not job:
             return jsonify({"error": "job not found"}), 404
-        return jsonify(job.to_dict())
+        updated = job.updated_at.timestamp() if job.updated_at else 0
+        etag = f"{updated:.6f}-{job.progress}"
+        if request.if_none_match.contains_weak(etag):
+            # هیچ تغییری از آخرین poll نبوده
+            resp = make_response("", 304)
+        else:
+            resp = jsonify(job.to_dict())
     finally:
         db.close()
+    resp.set_etag(etag, weak=True)
+    # مرورگر همیشه با If-None-Match دوباره بپرسد
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
 
 # ---------- Media ----------
 @app.route("/media")
@@ -322,10 +432,16 @@ def media_list():
     """
     db: Session = get_session()
     try:
-        medias = db.query(Media).order_by(Media.created_at.desc()).all()
-        return render_template("media.html", medias=medias)
+        medias = (
+            db.query(Media)
+            .options(selectinload(Media.project))
+            .order_by(Media.created_at.desc())
+            .all()
+        )
+        medias = [_row_with_project(m) for m in medias]
     finally:
         db.close()
+    return render_template("media.html", medias=medias)
 
 @app.route("/media/file/<int:media_id>")
 def media_file(media_id: int):
@@ -338,16 +454,29 @@ def media_file(media_id: int):
         if not media:
             flash("مدیا پیدا نشد.", "error")
             return redirect(url_for("media_list"))
-
-        directory = os.path.dirname(media.file_path)
-        fname = os.path.basename(media.file_path)
-        return send_from_directory(directory, fname, as_attachment=False)
+        file_path = media.file_path
     finally:
         db.close()
 
+    relpath = os.path.relpath(file_path, OUTPUT_DIR)
+    if MEDIA_ACCEL_PREFIX and not relpath.startswith(os.pardir):
+        resp = make_response("")
+        resp.headers["X-Accel-Redirect"] = MEDIA_ACCEL_PREFIX + quote(relpath.replace(os.sep, "/"))
+        resp.headers["Content-Type"] = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+        return resp
+
+    directory = os.path.dirname(file_path)
+    fname = os.path.basename(file_path)
+    return send_from_directory(directory, fname, as_attachment=False)
+
 # -------------------------------------------------------------------
 # Run
 # -------------------------------------------------------------------
 if __name__ == "__main__":
     # برای محیط توسعه
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    # motion.py is reloaded per job by motion_pipeline; editing it must not
+    # restart the app (that would kill the running render and the job queue)
+    app.run(
+        host="0.0.0.0", port=5000, debug=True,
+        exclude_patterns=[os.path.join(BASE_DIR, "motion.py")],
+    )
@@ -12,21 +12,28 @@ Creates beats.json:
 ]
 """
 
-import json
 import librosa
 import numpy as np
+import soundfile as sf
+
+from json_cache import write_json_atomic
 
 def analyze_beats(audio_path: str, out_path: str):
     print(f"[BEAT] Loading audio → {audio_path}")
-    y, sr = librosa.load(audio_path, sr=None, mono=True)
+    try:
+        # libsndfile decodes directly into a float32 array
+        y, sr = sf.read(audio_path, dtype="float32", always_2d=False)
+        if y.ndim == 2:
+            y = y.mean(axis=1)
+    except RuntimeError:
+        # formats libsndfile can't read (e.g. some mp3/m4a) → librosa fallback
+        y, sr = librosa.load(audio_path, sr=None, mono=True)
 
     print("[BEAT] Running beat_track...")
-    tempo, beat_frames = librosa.beat.beat_track(y=y, sr=sr)
-    beat_times = librosa.frames_to_time(beat_frames, sr=sr)
+    tempo, beat_times = librosa.beat.beat_track(y=y, sr=sr, units="time")
     beats = [float(t) for t in beat_times]
 
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(beats, f, ensure_ascii=False, indent=2)
+    write_json_atomic(beats, out_path)
 
     tempo_arr = np.atleast_1d(tempo)
     tempo_val = float(tempo_arr[0]) if tempo_arr.size > 0 else 0.0
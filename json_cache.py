@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+json_cache.py
+Shared writer for the JSON cache files (segments / beats).
+"""
+
+import os
+import orjson
+
+def write_json_atomic(obj, out_path: str):
+    """
+    Write obj as indented JSON to out_path via a temp file + os.replace,
+    so a crash never leaves a half-written cache file behind.
+    """
+    tmp_path = out_path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -14,15 +14,42 @@ import datetime
 from typing import Optional
 
 from sqlalchemy import (
-    create_engine, Column, Integer, String,
-    DateTime, Text, ForeignKey
+    create_engine, event, Column, Integer, String,
+    DateTime, Text, ForeignKey, Index
 )
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+from sqlalchemy.pool import QueuePool
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, "app.db")
 
-engine = create_engine(f"sqlite:///{DB_PATH}", echo=False, future=True)
+# The worker thread and Flask request threads share pooled connections,
+# so the PRAGMAs below run once per connection, not once per request.
+# QueuePool hand-off isn't strictly fair: keep transactions short.
+engine = create_engine(
+    f"sqlite:///{DB_PATH}",
+    echo=False,
+    future=True,
+    poolclass=QueuePool,
+    pool_size=5,
+    max_overflow=10,
+    pool_pre_ping=True,
+    connect_args={"check_same_thread": False},
+)
+
+@event.listens_for(engine, "connect")
+def set_sqlite_pragma(dbapi_connection, connection_record):
+    """
+    WAL lets the status pages read Job rows while the worker is
+    committing progress; busy_timeout waits instead of "database is locked".
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL;")
+    cursor.execute("PRAGMA busy_timeout=5000;")
+    cursor.execute("PRAGMA synchronous=NORMAL;")
+    cursor.execute("PRAGMA temp_store=MEMORY;")
+    cursor.close()
+
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
 Base = declarative_base()
@@ -42,8 +69,21 @@ class Project(Base):
     jobs = relationship("Job", back_populates="project", cascade="all, delete-orphan")
     medias = relationship("Media", back_populates="project", cascade="all, delete-orphan")
 
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "audio_path": self.audio_path,
+            "video_path": self.video_path,
+            "created_at": self.created_at.isoformat(sep=" ", timespec="seconds") if self.created_at else None,
+        }
+
 class Job(Base):
     __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_project_created", "project_id", "created_at"),
+        Index("ix_jobs_status_created", "status", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     uuid = Column(String(64), nullable=False, unique=True)
@@ -82,6 +122,9 @@ class Job(Base):
 
 class Media(Base):
     __tablename__ = "media"
+    __table_args__ = (
+        Index("ix_media_project_created", "project_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
@@ -93,3 +136,13 @@ class Media(Base):
 
     project = relationship("Project", back_populates="medias")
     job = relationship("Job", back_populates="medias")
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "project_id": self.project_id,
+            "job_id": self.job_id,
+            "file_path": self.file_path,
+            "media_type": self.media_type,
+            "created_at": self.created_at.isoformat(sep=" ", timespec="seconds") if self.created_at else None,
+        }
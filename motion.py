@@ -11,14 +11,35 @@ Manim scene for Farsi Kinetic Typography with:
 from manim import *
 import json
 import math
+import functools
+import numpy as np
 
 SEGMENTS_FILE = "segments.json"
 BEATS_FILE = "beats.json"
 FARSI_FONT = "B Nazanin"   # تغییر به فونت موجود روی سیستم‌تان
 
 MIN_WAIT = 1 / 30  # ~0.033s
+PULSE_SIGMA = 0.04  # width of a single beat pulse (seconds)
 
-def make_calligraphic_line(text, frame_w):
+def pulse_env_table(beats, duration, fps):
+    """
+    جدول شدت pulse برای هر فریم: مجموع گاوسی‌ها حول هر beat، حداکثر ۱.
+    هر beat فقط روی فریم‌های نزدیک خودش (±۴ سیگما) اثر دارد.
+    """
+    n = int(math.ceil(duration * fps)) + 1
+    env = np.zeros(n)
+    if len(beats) == 0:
+        return env
+
+    half = int(math.ceil(4 * PULSE_SIGMA * fps))
+    idx = np.rint(beats * fps).astype(int)[:, None] + np.arange(-half, half + 1)[None, :]
+    vals = np.exp(-((idx / fps - beats[:, None]) / PULSE_SIGMA) ** 2)
+    ok = (idx >= 0) & (idx < n)
+    np.add.at(env, idx[ok], vals[ok])
+    return np.minimum(env, 1.0)
+
+@functools.lru_cache(maxsize=256)
+def _calligraphic_prototype(text, frame_w):
     """
     ساخت استایل تایپوگرافی فارسی:
     - فونت خوشنویسی / دست‌نویس
@@ -48,7 +69,17 @@ def make_calligraphic_line(text, frame_w):
     group.scale(1.05)
     return group
 
+def make_calligraphic_line(text, frame_w):
+    """
+    کپی از نمونه‌ی کش‌شده؛ خطوط تکراری (ترجیع‌بند) دوباره با Pango ساخته نمی‌شوند.
+    """
+    return _calligraphic_prototype(text, round(frame_w, 2)).copy()
+
 class FarsiKinetic(Scene):
+    def _pulse_at(self, t):
+        i = min(max(int(t * self._fps), 0), len(self._env) - 1)
+        return self._env[i]
+
     def construct(self):
         # load segments
         with open(SEGMENTS_FILE, encoding="utf-8") as f:
@@ -60,7 +91,14 @@ class FarsiKinetic(Scene):
                 beats = json.load(f)
         except FileNotFoundError:
             beats = []
-        beats = sorted(float(b) for b in beats)
+        beats_arr = np.sort(np.asarray(beats, dtype=float))
+
+        # pulse envelope sampled once per frame; updaters only index into it
+        total_duration = max(
+            [float(seg["end"]) for seg in segments] + beats_arr.tolist() + [0.0]
+        ) + 1.0
+        self._fps = config.frame_rate
+        self._env = pulse_env_table(beats_arr, total_duration, self._fps)
 
         frame_w = self.camera.frame_width
         frame_h = self.camera.frame_height
@@ -75,7 +113,6 @@ class FarsiKinetic(Scene):
         self.add(border)
 
         current_time = 0.0
-        beat_index = 0
 
         for seg in segments:
             start = float(seg["start"])
@@ -111,38 +148,39 @@ class FarsiKinetic(Scene):
             )
             current_time += intro_rt
 
-            # hold + beat pulses
+            # hold + beat pulses: one play() for the whole hold, driven by a tracker
             hold_start = current_time
             hold_end = hold_start + hold_rt
-            local_t = hold_start
-
-            while beat_index < len(beats) and beats[beat_index] < hold_start - 0.01:
-                beat_index += 1
-
-            j = beat_index
-            while j < len(beats) and beats[j] <= hold_end + 0.01:
-                beat_time = beats[j]
-                dt = beat_time - local_t
-                if dt > MIN_WAIT:
-                    self.wait(dt)
-                    current_time += dt
-                    local_t += dt
-
-                pulse_rt = 0.08
+            lo = np.searchsorted(beats_arr, hold_start - 0.01, side="left")
+            hi = np.searchsorted(beats_arr, hold_end + 0.01, side="right")
+            seg_beats = beats_arr[lo:hi]
+
+            if len(seg_beats) == 0:
+                self.wait(hold_rt)
+            else:
+                vt = ValueTracker(0)
+                base_w = line.width
+
+                def pulse_line(m, hold_start=hold_start, base_w=base_w, vt=vt):
+                    env = self._pulse_at(hold_start + vt.get_value())
+                    m.scale_to_fit_width(base_w * (1 + 0.05 * env))
+
+                def pulse_border(m, hold_start=hold_start, vt=vt):
+                    env = self._pulse_at(hold_start + vt.get_value())
+                    m.set_stroke(opacity=0.18 + 0.27 * env, width=2 + env)
+
+                line.add_updater(pulse_line)
+                border.add_updater(pulse_border)
                 self.play(
-                    line.animate.scale(1.05),
-                    border.animate.set_stroke(opacity=0.45, width=3),
-                    run_time=pulse_rt,
-                    rate_func=there_and_back,
+                    vt.animate.set_value(hold_rt),
+                    run_time=hold_rt,
+                    rate_func=linear,
                 )
-                current_time += pulse_rt
-                local_t += pulse_rt
-                j += 1
-
-            remaining = hold_end - local_t
-            if remaining > MIN_WAIT:
-                self.wait(remaining)
-                current_time += remaining
+                line.remove_updater(pulse_line)
+                border.remove_updater(pulse_border)
+                line.scale_to_fit_width(base_w)
+                border.set_stroke(opacity=0.18, width=2)
+            current_time += hold_rt
 
             # exit
             self.play(
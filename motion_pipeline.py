@@ -10,21 +10,33 @@ You can import and call this from Flask or any other UI.
 """
 
 import os
+import importlib
 import subprocess
-import glob
-from pathlib import Path
-import hashlib
+import struct
 import datetime
 import random
 import string
 import shutil
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import blake3
+from manim import tempconfig
 
 import transcribe
 import beat_analysis
+import motion
 
 SCENE_NAME = "FarsiKinetic"
-MOTION_FILE = "motion.py"
+
+# -q flag of the manim CLI → config.quality
+MANIM_QUALITIES = {
+    "l": "low_quality",
+    "m": "medium_quality",
+    "h": "high_quality",
+    "p": "production_quality",
+    "k": "fourk_quality",
+}
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CACHE_DIR = os.path.join(BASE_DIR, "cache")
@@ -33,46 +45,104 @@ MEDIA_DIR = os.path.join(BASE_DIR, "media")
 os.makedirs(CACHE_DIR, exist_ok=True)
 os.makedirs(MEDIA_DIR, exist_ok=True)
 
-def _hash_file(path: str, chunk_size: int = 8192) -> str:
-    md5 = hashlib.md5()
+def _hash_file(path: str, sample_size: int = 1 << 20) -> str:
+    """
+    Cache key for an input file: size + first/last `sample_size` bytes,
+    hashed with BLAKE3. Files up to 2 * sample_size are hashed in full.
+    """
+    size = os.stat(path).st_size
+    h = blake3.blake3()
+    h.update(struct.pack("<q", size))
     with open(path, "rb") as f:
-        while True:
-            data = f.read(chunk_size)
-            if not data:
-                break
-            md5.update(data)
-    return md5.hexdigest()
+        if hasattr(os, "posix_fadvise"):
+            # prefetch the whole file: Whisper and Librosa read all of it next
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+        h.update(f.read(sample_size))
+        if size > sample_size:
+            f.seek(max(sample_size, size - sample_size))
+            h.update(f.read())
+    return h.hexdigest()
+
+def _link_cached(src: str, dest: str):
+    """
+    Point dest (segments.json / beats.json read by motion.py) at a cache file.
+    Cache paths are content-addressed, so a symlink already pointing at src
+    is up to date. Falls back to a plain copy where symlinks aren't allowed.
+    """
+    if os.path.islink(dest) and os.readlink(dest) == src:
+        return
+    if os.path.lexists(dest):
+        os.remove(dest)
+    try:
+        os.symlink(src, dest)
+    except (OSError, NotImplementedError):
+        shutil.copyfile(src, dest)
 
 def _unique_id() -> str:
     ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     rnd = "".join(random.choices("abcdefghijklmnopqrstuvwxyz0123456789", k=4))
     return f"{ts}_{rnd}"
 
-def _run_manim(quality: str = "h") -> str:
+_motion_mtime = os.path.getmtime(motion.__file__)
+
+def _load_scene():
     """
-    Run Manim to render the scene FarsiKinetic from motion.py.
-    Output may be .mp4 or .mov; we match with wildcard.
+    Return FarsiKinetic from motion.py, reloading the module if the file was
+    edited since the last render (so a new job picks up the changes without
+    restarting the app). Reloading re-runs motion.py, so its Text prototype
+    cache starts empty.
     """
-    if quality not in {"l", "m", "h", "p", "k"}:
-        quality = "h"
-
-    cmd = [
-        "manim",
-        f"-q{quality}",
-        "-t",     # transparent background
-        MOTION_FILE,
-        SCENE_NAME,
-    ]
-    subprocess.run(cmd, check=True)
-
-    pattern = os.path.join(
-        MEDIA_DIR, "videos", Path(MOTION_FILE).stem, "*", f"{SCENE_NAME}.*"
-    )
-    matches = glob.glob(pattern)
-    if not matches:
-        raise FileNotFoundError(f"Could not find Manim output with pattern: {pattern}")
-    matches.sort(key=os.path.getmtime)
-    return matches[-1]
+    global _motion_mtime
+    mtime = os.path.getmtime(motion.__file__)
+    if mtime != _motion_mtime:
+        importlib.reload(motion)
+        _motion_mtime = mtime
+    return motion.FarsiKinetic
+
+def _run_manim(uid: str, output_dir: str, quality: str = "h") -> str:
+    """
+    Render the scene FarsiKinetic from motion.py in-process, so Manim,
+    Cairo and Pango are initialized once per worker instead of once per job.
+    The transparent movie is written straight to output_dir/manim_<uid>.*
+    and its path is returned.
+    """
+    quality = MANIM_QUALITIES.get(quality, MANIM_QUALITIES["h"])
+
+    with tempconfig({
+        "quality": quality,
+        "transparent": True,   # transparent background
+        "media_dir": MEDIA_DIR,
+        "video_dir": output_dir,
+        # fixed dir (not per-uid) so Manim's play() cache is reused across jobs
+        "partial_movie_dir": os.path.join(MEDIA_DIR, "partial_movie_files", SCENE_NAME),
+        "output_file": f"manim_{uid}",
+    }):
+        scene = _load_scene()()
+        scene.render()
+        out = str(scene.renderer.file_writer.movie_file_path)
+
+    if not os.path.exists(out):
+        raise FileNotFoundError(f"Could not find Manim output: {out}")
+    return out
+
+def _has_encoder(name: str) -> bool:
+    """
+    Check whether the local ffmpeg build provides the given encoder.
+    """
+    try:
+        out = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-encoders"],
+            capture_output=True, text=True, check=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return False
+    return name in out
+
+# probed once per process
+HAS_NVENC = _has_encoder("h264_nvenc")
+
+NVENC_ARGS = ["-c:v", "h264_nvenc", "-preset", "p4", "-b:v", "6M"]
+X264_ARGS = ["-c:v", "libx264", "-preset", "veryfast", "-crf", "23"]
 
 def _overlay_video(base_video: str, overlay_video: str, audio: str, output: str):
     """
@@ -84,21 +154,30 @@ def _overlay_video(base_video: str, overlay_video: str, audio: str, output: str)
         "[0:v][fg]overlay=(W-w)/2:(H-h)/2:format=auto[vout]"
     )
 
-    cmd = [
-        "ffmpeg",
-        "-y",
-        "-stream_loop", "-1", "-i", base_video,   # 0:v
-        "-i", overlay_video,                      # 1:v
-        "-i", audio,                              # 2:a
-        "-filter_complex", filter_complex,
-        "-map", "[vout]",
-        "-map", "2:a",
-        "-c:v", "libx264",
-        "-c:a", "aac",
-        "-shortest",
-        output,
-    ]
-    subprocess.run(cmd, check=True)
+    # NVENC can be compiled in without a usable GPU → fall back to libx264
+    codecs = [NVENC_ARGS, X264_ARGS] if HAS_NVENC else [X264_ARGS]
+    for i, video_codec in enumerate(codecs):
+        cmd = [
+            "ffmpeg",
+            "-y",
+            "-stream_loop", "-1", "-i", base_video,   # 0:v
+            "-i", overlay_video,                      # 1:v
+            "-i", audio,                              # 2:a
+            "-filter_complex", filter_complex,
+            "-map", "[vout]",
+            "-map", "2:a",
+            *video_codec,
+            "-c:a", "aac",
+            "-movflags", "+faststart",
+            "-shortest",
+            output,
+        ]
+        try:
+            subprocess.run(cmd, check=True)
+            return
+        except subprocess.CalledProcessError:
+            if i == len(codecs) - 1:
+                raise
 
 def process_job(
     audio_path: str,
@@ -125,34 +204,39 @@ def process_job(
     seg_cache = os.path.join(CACHE_DIR, f"segments_{audio_hash}.json")
     beats_cache = os.path.join(CACHE_DIR, f"beats_{audio_hash}.json")
 
-    # segments.json
-    if os.path.exists(seg_cache):
-        _update(15, "استفاده از کش متن...")
-        shutil.copy(seg_cache, os.path.join(BASE_DIR, "segments.json"))
+    # Whisper and Librosa are independent and spend their time in native code,
+    # so on a cache miss they run side by side.
+    tasks = []  # (label, fn, cache path, done message)
+    if not os.path.exists(seg_cache):
+        tasks.append(("تبدیل صوت به متن (Whisper)", transcribe.transcribe_audio, seg_cache,
+                      "تبدیل صوت به متن انجام شد..."))
+    if not os.path.exists(beats_cache):
+        tasks.append(("تحلیل ضرب آهنگ (Librosa)", beat_analysis.analyze_beats, beats_cache,
+                      "تحلیل ضرب آهنگ انجام شد..."))
+
+    if not tasks:
+        _update(15, "استفاده از کش متن و ضرب‌ها...")
     else:
-        _update(15, "تبدیل صوت به متن (Whisper)...")
-        transcribe.transcribe_audio(audio_path, seg_cache)
-        shutil.copy(seg_cache, os.path.join(BASE_DIR, "segments.json"))
-
-    # beats.json
-    if os.path.exists(beats_cache):
-        _update(35, "استفاده از کش ضرب‌ها...")
-        shutil.copy(beats_cache, os.path.join(BASE_DIR, "beats.json"))
-    else:
-        _update(35, "تحلیل ضرب آهنگ (Librosa)...")
-        beat_analysis.analyze_beats(audio_path, beats_cache)
-        shutil.copy(beats_cache, os.path.join(BASE_DIR, "beats.json"))
-
-    _update(55, "رندر موشن با Manim...")
-    manim_out = _run_manim(quality=quality)
+        _update(15, " + ".join(label for label, _, _, _ in tasks) + "...")
+        with ThreadPoolExecutor(max_workers=2) as ex:
+            pending = {
+                ex.submit(fn, audio_path, cache): done_msg
+                for _, fn, cache, done_msg in tasks
+            }
+            for done, fut in enumerate(as_completed(pending), start=1):
+                fut.result()
+                _update(15 + 40 * done // len(pending), pending[fut])
+
+    _link_cached(seg_cache, os.path.join(BASE_DIR, "segments.json"))
+    _link_cached(beats_cache, os.path.join(BASE_DIR, "beats.json"))
 
     uid = _unique_id()
-    overlay_src = os.path.join(output_dir, f"manim_{uid}{Path(manim_out).suffix}")
-    shutil.copy(manim_out, overlay_src)
+    _update(55, "رندر موشن با Manim...")
+    manim_out = _run_manim(uid, output_dir, quality=quality)
 
     final_output = os.path.join(output_dir, f"final_{uid}.mp4")
     _update(80, "ترکیب موشن با ویدیو اصلی (ffmpeg)...")
-    _overlay_video(base_video=video_path, overlay_video=overlay_src, audio=audio_path, output=final_output)
+    _overlay_video(base_video=video_path, overlay_video=manim_out, audio=audio_path, output=final_output)
 
     _update(100, "تمام شد ✅")
     return final_output
@@ -2,37 +2,67 @@
 # -*- coding: utf-8 -*-
 """
 transcribe.py
-Simple wrapper around OpenAI Whisper to generate segments.json:
+Simple wrapper around faster-whisper (CTranslate2) to generate segments.json:
 [
   {"start": ..., "end": ..., "text": "..."},
   ...
 ]
 """
 
-import json
-import whisper
+import os
+import ctranslate2
+from faster_whisper import WhisperModel
+
+from json_cache import write_json_atomic
+
+WHISPER_MODEL = "small"
+
+# Loaded once per process and reused by every job
+_MODEL = None
+
+def _get_model():
+    global _MODEL
+    if _MODEL is None:
+        device, compute_type = "cpu", "int8"
+        if ctranslate2.get_cuda_device_count() > 0:
+            # int8 needs compute capability >= 6.1; older cards get float16 (or CPU)
+            supported = ctranslate2.get_supported_compute_types("cuda")
+            for gpu_type in ("int8_float16", "float16", "int8"):
+                if gpu_type in supported:
+                    device, compute_type = "cuda", gpu_type
+                    break
+        # ~physical cores; leaves the other half for librosa running alongside
+        cpu_threads = max(1, (os.cpu_count() or 2) // 2)
+        print(f"[TRANSCRIBE] Loading Whisper model ({WHISPER_MODEL}, {device}/{compute_type})...")
+        _MODEL = WhisperModel(
+            WHISPER_MODEL,
+            device=device,
+            compute_type=compute_type,
+            cpu_threads=cpu_threads,
+            num_workers=1,
+        )
+    return _MODEL
 
 def transcribe_audio(audio_path: str, out_path: str):
     """
     Transcribe the given audio file and write segments (start/end/text)
     into out_path.
     """
-    print("[TRANSCRIBE] Loading Whisper model (small)...")
-    model = whisper.load_model("small")
+    model = _get_model()
 
     print(f"[TRANSCRIBE] Transcribing: {audio_path}")
-    result = model.transcribe(audio_path, language="fa", fp16=False)
+    # vad_filter skips silent regions so they are never decoded
+    result, _info = model.transcribe(audio_path, language="fa", vad_filter=True)
 
     segments = []
-    for seg in result.get("segments", []):
+    for seg in result:
         segments.append({
-            "start": float(seg["start"]),
-            "end": float(seg["end"]),
-            "text": seg.get("text", "").strip(),
+            "start": float(seg.start),
+            "end": float(seg.end),
+            "text": (seg.text or "").strip(),
         })
 
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(segments, f, ensure_ascii=False, indent=2)
+    write_json_atomic(segments, out_path)
 
     print(f"[TRANSCRIBE] Saved segments → {out_path}")
     return out_path